@@ -5,7 +5,8 @@ CRUD-операции для системы управления продажа
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, select, update
+from sqlalchemy.orm import Session, raiseload, selectinload
 
 from backend import models
 from backend import schemas
@@ -13,8 +14,12 @@ from backend import schemas
 
 # --- Автомобили ---
 
-def create_car(db: Session, car: schemas.CarCreate) -> models.Car:
-    """Создать новый автомобиль и запись в Operation с типом «поступление»."""
+def create_car(db: Session, car: schemas.CarCreate, commit: bool = True) -> models.Car:
+    """
+    Создать новый автомобиль и запись в Operation с типом «поступление».
+    commit=False оставляет изменения в открытой транзакции (flush) —
+    для пакетных импортов, которые фиксируют весь файл одним commit.
+    """
     db_car = models.Car(
         vin=car.vin,
         model=car.model,
@@ -25,8 +30,9 @@ def create_car(db: Session, car: schemas.CarCreate) -> models.Car:
         location="склад",
     )
     db.add(db_car)
-    db.commit()
-    db.refresh(db_car)
+    # flush вместо commit: получаем db_car.id, оставаясь в одной транзакции —
+    # Car и Operation фиксируются (или откатываются) вместе, одним fsync
+    db.flush()
 
     # Лог операции «поступление»
     db_operation = models.Operation(
@@ -37,7 +43,11 @@ def create_car(db: Session, car: schemas.CarCreate) -> models.Car:
         user="system",
     )
     db.add(db_operation)
-    db.commit()
+    if commit:
+        db.commit()
+        db.refresh(db_car)
+    else:
+        db.flush()
 
     return db_car
 
@@ -52,14 +62,39 @@ def get_car_by_vin(db: Session, vin: str) -> models.Car | None:
     return db.query(models.Car).filter(models.Car.vin == vin).first()
 
 
+def vin_exists(db: Session, vin: str) -> bool:
+    """
+    Проверить существование VIN через EXISTS — без выборки всех колонок
+    и создания ORM-объекта, в отличие от get_car_by_vin.
+    """
+    return db.query(exists().where(models.Car.vin == vin)).scalar()
+
+
+def get_car_status_by_vin(db: Session, vin: str) -> Optional[tuple[int, str]]:
+    """
+    Получить (id, status) автомобиля по VIN — без выборки всех колонок
+    и конструирования ORM-объекта. Для предварительных проверок в
+    эндпоинтах, где полный автомобиль нужен только на пути обновления.
+    """
+    row = db.execute(
+        select(models.Car.id, models.Car.status).where(models.Car.vin == vin)
+    ).first()
+    return (row.id, row.status) if row is not None else None
+
+
 def get_cars(
     db: Session,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
 ) -> List[models.Car]:
-    """Получить список автомобилей с пагинацией и опциональным фильтром по статусу."""
-    q = db.query(models.Car)
+    """
+    Получить список автомобилей с пагинацией и опциональным фильтром по статусу.
+    raiseload('*') — стратегия загрузки явная: ответ сериализует только
+    скалярные колонки, а случайное обращение к связи (скрытый N+1)
+    падает сразу, вместо тихого запроса на каждую строку.
+    """
+    q = db.query(models.Car).options(raiseload("*"))
     if status is not None:
         q = q.filter(models.Car.status == status)
     return q.offset(skip).limit(limit).all()
@@ -67,13 +102,24 @@ def get_cars(
 
 def get_cars_in_stock(db: Session) -> List[models.Car]:
     """Получить только автомобили со статусом «на складе»."""
-    return db.query(models.Car).filter(models.Car.status == "на складе").all()
+    return (
+        db.query(models.Car)
+        .options(raiseload("*"))
+        .filter(models.Car.status == "на складе")
+        .all()
+    )
 
 
 def update_car(
     db: Session, car_id: int, car_update: schemas.CarUpdate
 ) -> models.Car | None:
-    """Обновить данные автомобиля (только переданные поля)."""
+    """
+    Обновить данные автомобиля (только переданные поля).
+    Внимание: агрегаты покупателя (Buyer.total_spent / purchases_count)
+    здесь не пересчитываются. Продажи оформляются через sell_car, откат —
+    через delete_car; прямая правка status/sale_price/buyer_id этим
+    методом разойдётся с агрегатами.
+    """
     db_car = get_car(db, car_id)
     if not db_car:
         return None
@@ -93,6 +139,19 @@ def delete_car(db: Session, car_id: int) -> bool:
     if not db_car:
         return False
 
+    # Проданный автомобиль учтён в агрегатах покупателя — откатить их,
+    # иначе отчёт о покупателях продолжит считать удалённую продажу
+    if db_car.status == "продан" and db_car.buyer_id is not None:
+        db.execute(
+            update(models.Buyer)
+            .where(models.Buyer.id == db_car.buyer_id)
+            .values(
+                total_spent=models.Buyer.total_spent - (db_car.sale_price or 0),
+                purchases_count=models.Buyer.purchases_count - 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
     # Удалить связанные записи (Operation, Movement)
     db.query(models.Operation).filter(models.Operation.car_id == car_id).delete()
     db.query(models.Movement).filter(models.Movement.car_id == car_id).delete()
@@ -113,21 +172,19 @@ def _status_by_location(to_location: str) -> str:
     return mapping.get(to_location.lower().strip(), "на складе")
 
 
-def move_car(
+def _move_car_for_object(
     db: Session,
-    vin: str,
+    db_car: models.Car,
     from_location: str,
     to_location: str,
     date: datetime,
+    commit: bool = True,
 ) -> models.Movement | None:
     """
-    Переместить автомобиль по VIN: создать Movement, обновить location и status,
-    записать операцию «перемещение».
+    Переместить уже загруженный автомобиль: создать Movement, обновить
+    location и status, записать операцию «перемещение». Без SELECT по VIN —
+    для импортёров, которые подгружают автомобили одним IN-запросом.
     """
-    db_car = get_car_by_vin(db, vin)
-    if not db_car:
-        return None
-
     # Проверка текущего местоположения (пропуск, если from_location пустой)
     if from_location and db_car.location != from_location:
         return None
@@ -147,19 +204,42 @@ def move_car(
     db_car.status = _status_by_location(to_location)
 
     # Лог операции «перемещение»
-    db_operation = models.Operation(
+    db.add(models.Operation(
         car_id=db_car.id,
         operation_type="перемещение",
         date=date,
-        details=f"Перемещение VIN {vin}: {db_movement.from_location} -> {to_location}",
+        details=f"Перемещение VIN {db_car.vin}: {db_movement.from_location} -> {to_location}",
         user="system",
-    )
-    db.add(db_operation)
-    db.commit()
-    db.refresh(db_movement)
+    ))
+    if commit:
+        db.commit()
+        db.refresh(db_movement)
+    else:
+        db.flush()
     return db_movement
 
 
+def move_car(
+    db: Session,
+    vin: str,
+    from_location: str,
+    to_location: str,
+    date: datetime,
+    car: models.Car | None = None,
+    commit: bool = True,
+) -> models.Movement | None:
+    """
+    Переместить автомобиль по VIN: тонкая обёртка над _move_car_for_object.
+    Если автомобиль уже загружен, его можно передать через `car` —
+    тогда SELECT по VIN не выполняется.
+    commit=False — для пакетных импортов с одним commit на весь файл.
+    """
+    db_car = car if car is not None else get_car_by_vin(db, vin)
+    if not db_car:
+        return None
+    return _move_car_for_object(db, db_car, from_location, to_location, date, commit=commit)
+
+
 def get_car_movements(db: Session, car_id: int) -> List[models.Movement]:
     """Получить историю перемещений автомобиля."""
     return (
@@ -171,12 +251,18 @@ def get_car_movements(db: Session, car_id: int) -> List[models.Movement]:
 
 
 def get_all_movements(
-    db: Session, skip: int = 0, limit: int = 100
+    db: Session, skip: int = 0, limit: int = 100, load_related: bool = False
 ) -> List[models.Movement]:
-    """Получить все перемещения с пагинацией."""
+    """
+    Получить все перемещения с пагинацией.
+    load_related=True подгружает Movement.car пакетно (selectinload),
+    чтобы обращения к связи не порождали запрос на каждую строку (N+1).
+    """
+    q = db.query(models.Movement)
+    if load_related:
+        q = q.options(selectinload(models.Movement.car))
     return (
-        db.query(models.Movement)
-        .order_by(models.Movement.date.desc())
+        q.order_by(models.Movement.date.desc())
         .offset(skip)
         .limit(limit)
         .all()
@@ -206,42 +292,53 @@ def get_buyer_by_name(db: Session, name: str) -> models.Buyer | None:
 def get_buyers(
     db: Session, skip: int = 0, limit: int = 100
 ) -> List[models.Buyer]:
-    """Получить список покупателей с пагинацией."""
-    return db.query(models.Buyer).offset(skip).limit(limit).all()
+    """
+    Получить список покупателей с пагинацией.
+    Buyer.cars подгружается пакетно: BuyerResponse всегда сериализует список
+    автомобилей, без selectinload это был бы запрос на каждого покупателя.
+    """
+    return (
+        db.query(models.Buyer)
+        .options(selectinload(models.Buyer.cars))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
 
 
 # --- Продажи ---
 
-def sell_car(
+def _sell_car_for_object(
     db: Session,
-    vin: str,
+    db_car: models.Car,
     sale_price: float,
     buyer_name: str,
     buyer_phone: Optional[str] = None,
     buyer_email: Optional[str] = None,
     sale_date: Optional[datetime] = None,
+    commit: bool = True,
+    op_rows: Optional[List[dict]] = None,
 ) -> models.Car | None:
     """
-    Продать автомобиль по VIN: создать/найти покупателя, обновить авто,
-    записать операцию «продажа».
+    Продать уже загруженный автомобиль: создать/найти покупателя, обновить
+    авто, записать операцию «продажа». Без SELECT по VIN — для импортёров.
+    Если передан op_rows, маппинг операции складывается в него для
+    последующей пакетной вставки вместо db.add на каждую строку.
     """
-    db_car = get_car_by_vin(db, vin)
-    if not db_car:
-        return None
     if db_car.status == "продан":
         return None
 
     # Создать или найти покупателя по имени
+    # (новый покупатель добавляется через flush — фиксация вместе с продажей)
     db_buyer = get_buyer_by_name(db, buyer_name)
     if not db_buyer:
-        db_buyer = create_buyer(
-            db,
-            schemas.BuyerCreate(
-                name=buyer_name,
-                phone=buyer_phone,
-                email=buyer_email,
-            ),
+        db_buyer = models.Buyer(
+            name=buyer_name,
+            phone=buyer_phone,
+            email=buyer_email,
         )
+        db.add(db_buyer)
+        db.flush()
 
     # Обновить автомобиль
     db_car.status = "продан"
@@ -249,27 +346,86 @@ def sell_car(
     db_car.sale_date = sale_date if sale_date is not None else datetime.utcnow()
     db_car.buyer_id = db_buyer.id
 
-    # Лог операции «продажа»
-    db_operation = models.Operation(
-        car_id=db_car.id,
-        operation_type="продажа",
-        date=db_car.sale_date,
-        details=f"Продажа VIN {vin} покупателю {buyer_name}, цена {sale_price}",
-        user="system",
+    # Денормализованные агрегаты покупателя: атомарный UPDATE в той же
+    # транзакции (инкремент на стороне БД — без гонки чтение-изменение-запись)
+    db.execute(
+        update(models.Buyer)
+        .where(models.Buyer.id == db_buyer.id)
+        .values(
+            total_spent=models.Buyer.total_spent + sale_price,
+            purchases_count=models.Buyer.purchases_count + 1,
+        )
+        .execution_options(synchronize_session=False)
     )
-    db.add(db_operation)
-    db.commit()
-    db.refresh(db_car)
+
+    # Лог операции «продажа»
+    operation = {
+        "car_id": db_car.id,
+        "operation_type": "продажа",
+        "date": db_car.sale_date,
+        "details": f"Продажа VIN {db_car.vin} покупателю {buyer_name}, цена {sale_price}",
+        "user": "system",
+    }
+    if op_rows is not None:
+        op_rows.append(operation)
+    else:
+        db.add(models.Operation(**operation))
+    if commit:
+        db.commit()
+        db.refresh(db_car)
+    else:
+        db.flush()
     return db_car
 
 
+def sell_car(
+    db: Session,
+    vin: str,
+    sale_price: float,
+    buyer_name: str,
+    buyer_phone: Optional[str] = None,
+    buyer_email: Optional[str] = None,
+    sale_date: Optional[datetime] = None,
+    car: models.Car | None = None,
+    commit: bool = True,
+) -> models.Car | None:
+    """
+    Продать автомобиль по VIN: тонкая обёртка над _sell_car_for_object.
+    Если автомобиль уже загружен, его можно передать через `car` —
+    тогда SELECT по VIN не выполняется.
+    commit=False — для пакетных импортов с одним commit на весь файл.
+    """
+    db_car = car if car is not None else get_car_by_vin(db, vin)
+    if not db_car:
+        return None
+    return _sell_car_for_object(
+        db,
+        db_car,
+        sale_price=sale_price,
+        buyer_name=buyer_name,
+        buyer_phone=buyer_phone,
+        buyer_email=buyer_email,
+        sale_date=sale_date,
+        commit=commit,
+    )
+
+
 def get_sold_cars(
     db: Session,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    load_related: bool = False,
 ) -> List[models.Car]:
-    """Получить проданные автомобили, при необходимости отфильтровать по периоду (sale_date)."""
+    """
+    Получить проданные автомобили, при необходимости отфильтровать по периоду (sale_date).
+    load_related=True пакетно подгружает Car.buyer (selectinload) против N+1;
+    иначе связи закрыты raiseload — ленивый доступ падает, а не делает запрос.
+    """
     q = db.query(models.Car).filter(models.Car.status == "продан")
+    if load_related:
+        q = q.options(selectinload(models.Car.buyer))
+    else:
+        q = q.options(raiseload("*"))
     if start_date is not None:
         q = q.filter(models.Car.sale_date >= start_date)
     if end_date is not None:
@@ -2,27 +2,110 @@
 Настройка подключения к SQLite базе данных с использованием SQLAlchemy.
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool
 
 # Путь к БД: ./car_sales.db (относительно рабочей директории)
 SQLALCHEMY_DATABASE_URL = "sqlite:///./car_sales.db"
 
-# Движок с настройками для SQLite
-# check_same_thread=False — для совместимости с FastAPI (несколько потоков)
+# Движок — единственный на процесс (модульный синглтон), соединения
+# переиспользуются пулом вместо открытия БД на каждый запрос.
+# check_same_thread=False — для совместимости с FastAPI (несколько потоков).
+# Для in-memory БД нужен StaticPool: одно разделяемое соединение,
+# иначе каждое новое соединение видит пустую базу.
+# Для файловой БД пул расширен под конкурентную нагрузку: каждый sync-эндпоинт
+# держит соединение весь запрос, и со стандартными size=5/overflow=10 очередь
+# упирается в QueuePool timeout уже при ~15 параллельных запросах.
+# pool_size + max_overflow подбираются под число рабочих потоков сервера.
+_POOL_KWARGS = (
+    {"poolclass": StaticPool}
+    if ":memory:" in SQLALCHEMY_DATABASE_URL
+    else {
+        "pool_size": 20,
+        "max_overflow": 30,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,  # защита от устаревших соединений при долгой работе
+    }
+)
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
+    pool_pre_ping=True,
     echo=False,  # True для отладки SQL-запросов
+    **_POOL_KWARGS,
+)
+
+# PRAGMA-настройки SQLite на каждое подключение:
+# WAL — читатели не блокируются писателем, fsync дешевле;
+# synchronous=NORMAL — безопасно в сочетании с WAL;
+# остальное — кеш/временные данные в памяти и mmap для чтения.
+_SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "mmap_size=268435456",
+    "cache_size=-65536",
+    "foreign_keys=ON",
 )
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Применить PRAGMA-настройки при каждом новом подключении к SQLite."""
+    cursor = dbapi_connection.cursor()
+    for pragma in _SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
 # Фабрика сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: после commit атрибуты объектов не сбрасываются,
+# чтение полей для сериализации ответа не порождает скрытых re-SELECT.
+# CRUD-функции и так делают явный db.refresh там, где нужны свежие данные.
+SessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=engine,
+    expire_on_commit=False,
+)
 
 # Базовый класс для декларативных моделей
 Base = declarative_base()
 
 
+def migrate_schema() -> None:
+    """
+    Лёгкие миграции схемы при старте: create_all создаёт только отсутствующие
+    таблицы и не трогает существующие, поэтому добавленные позже колонки и
+    индексы нужно доводить вручную. Вызывается после create_all — когда
+    модели уже импортированы и Base.metadata заполнена.
+    """
+    with engine.begin() as conn:
+        # Денормализованные агрегаты покупателя (total_spent, purchases_count):
+        # добавить колонки и заполнить из существующих продаж
+        buyer_cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(buyers)")}
+        if buyer_cols and "total_spent" not in buyer_cols:
+            conn.exec_driver_sql(
+                "ALTER TABLE buyers ADD COLUMN total_spent FLOAT NOT NULL DEFAULT 0.0"
+            )
+            conn.exec_driver_sql(
+                "ALTER TABLE buyers ADD COLUMN purchases_count INTEGER NOT NULL DEFAULT 0"
+            )
+            conn.exec_driver_sql(
+                "UPDATE buyers SET "
+                "total_spent = COALESCE((SELECT SUM(c.sale_price) FROM cars c "
+                "WHERE c.buyer_id = buyers.id AND c.status = 'продан'), 0.0), "
+                "purchases_count = (SELECT COUNT(*) FROM cars c "
+                "WHERE c.buyer_id = buyers.id AND c.status = 'продан')"
+            )
+
+        # Индексы, объявленные в моделях: для существующих таблиц create_all
+        # их не создаёт, checkfirst пропускает уже существующие
+        for table in Base.metadata.tables.values():
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
 def get_db():
     """
     Генератор сессии БД для dependency injection в FastAPI.
@@ -5,17 +5,38 @@
 
 import csv
 import logging
+import re
+from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import List, Any
+from typing import Any, Iterable, Iterator, List
 
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
-from backend import crud, schemas
+from backend import crud, models
+
+# pandas — опциональный ускоритель парсинга: валидация выполняется
+# векторизованно по колонкам (C-код) вместо цикла по строкам.
+# Без pandas используется стандартный csv-парсер.
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover
+    pd = None
 
 logger = logging.getLogger(__name__)
 
+# Размер пакета для bulk-вставок и IN-списков (лимит параметров SQLite — 32766)
+_CHUNK_SIZE = 10_000
+
+# Буфер чтения CSV: 1 МиБ вместо стандартных 8 КиБ — меньше syscall-ов
+# и реаллокаций на больших файлах
+_READ_BUFFER = 1 << 20
+
 
 @dataclass
 class FileLoadResult:
@@ -25,289 +46,709 @@ class FileLoadResult:
     errors: List[str]
 
 
+# Предкомпилированный шаблон VIN: 17 латинских букв/цифр.
+# Одна проверка в C-коде re вместо двух Python-вызовов (len + isalnum).
+_VIN_RE = re.compile(r"\A[A-Za-z0-9]{17}\Z")
+
+
 def validate_vin(vin: str) -> bool:
-    """Проверить формат VIN: 17 символов, буквы и цифры."""
-    if not vin or len(vin) != 17:
-        return False
-    return vin.isalnum()
+    """Проверить формат VIN: 17 символов, латинские буквы и цифры."""
+    return bool(_VIN_RE.match(vin)) if vin else False
+
+
+@lru_cache(maxsize=8192)
+def _strptime_ymd(date_str: str) -> datetime | None:
+    """
+    strptime с мемоизацией: в CSV одна и та же дата повторяется тысячами строк
+    (партия одного дня поступления), повторный разбор — просто поиск в кеше.
+    """
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return None
 
 
 def validate_date(date_str: str) -> datetime | None:
     """Распарсить дату из строки (формат YYYY-MM-DD)."""
     if not date_str or not date_str.strip():
         return None
+    return _strptime_ymd(date_str.strip())
+
+
+def _cell(row: List[str], index: int) -> str:
+    """Значение колонки по позиции (пустая строка, если колонки нет)."""
+    return row[index].strip() if 0 <= index < len(row) else ""
+
+
+def _parse_file_vectorized(source: Any, file_type: str) -> FileLoadResult:
+    """
+    Векторизованный парсинг CSV через pandas: валидация дат, VIN, цен
+    и обязательных полей выполняется по целым колонкам, а не по строкам.
+    source — путь или открытый текстовый поток (pd.read_csv принимает оба).
+    Результат и тексты ошибок совпадают с построчным парсером для файлов
+    с выровненными строками. Лишнее завершающее поле во всех строках
+    (например, «;» в конце каждой строки) отбрасывается — как и в построчном
+    парсере; строка, чья ширина отличается от остальных, отбраковывает
+    весь файл ошибкой разбора, тогда как построчный парсер пропустил бы
+    лишние поля.
+    """
+    errors: List[tuple[int, str]] = []
+
     try:
-        return datetime.strptime(date_str.strip(), "%Y-%m-%d")
-    except ValueError:
-        return None
+        # index_col=False: без него pandas при равномерно «рваных» строках
+        # молча переносит первую колонку в индекс, и df.index + 2 ниже
+        # падает на строковом индексе (HTTP 500 вместо ошибки валидации)
+        df = pd.read_csv(source, sep=";", dtype=str, keep_default_na=False, index_col=False)
+    except pd.errors.EmptyDataError:
+        return FileLoadResult(success=True, data=[], errors=[])
+    except OSError as e:
+        return FileLoadResult(success=False, data=[], errors=[f"Ошибка чтения файла: {e}"])
+    except Exception as e:
+        return FileLoadResult(success=False, data=[], errors=[f"Ошибка разбора файла: {e}"])
+
+    # Нормализация заголовков — один раз на файл, не на строку
+    df.columns = [c.strip() for c in df.columns]
+    for col in ("date", "vin", "model", "color", "from_location",
+                "to_location", "buyer_name", "purchase_price", "sale_price"):
+        if col in df.columns:
+            df[col] = df[col].str.strip()
+        else:
+            df[col] = ""
 
+    row_nums = df.index + 2  # номер строки в файле (после заголовка)
 
-def parse_arrivals_file(file_path: str) -> FileLoadResult:
+    # Дата
+    dates = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    bad = dates.isna()
+    for i in df.index[bad]:
+        errors.append((row_nums[i], f"Строка {row_nums[i]}: неверная дата '{df['date'][i]}'"))
+
+    # VIN (только ещё не забракованные строки — как в построчном парсере)
+    vin_ok = df["vin"].str.match(_VIN_RE)
+    bad_vin = ~vin_ok & ~bad
+    suffix = " (ожидается 17 букв/цифр)" if file_type == "arrivals" else ""
+    for i in df.index[bad_vin]:
+        errors.append((row_nums[i], f"Строка {row_nums[i]}: неверный VIN '{df['vin'][i]}'{suffix}"))
+    bad |= ~vin_ok
+
+    if file_type == "arrivals":
+        price = pd.to_numeric(df["purchase_price"].str.replace(",", ".", regex=False), errors="coerce")
+        bad_price = price.isna() & ~bad
+        for i in df.index[bad_price]:
+            errors.append((row_nums[i], f"Строка {row_nums[i]}: неверная цена закупки '{df['purchase_price'][i]}'"))
+        bad |= price.isna()
+
+        bad_req = (df["model"].eq("") | df["color"].eq("")) & ~bad
+        for i in df.index[bad_req]:
+            errors.append((row_nums[i], f"Строка {row_nums[i]}: модель и цвет обязательны"))
+        bad |= df["model"].eq("") | df["color"].eq("")
+
+        good = df.index[~bad]
+        data = [
+            {
+                "date": dates[i].to_pydatetime(),
+                "model": df["model"][i],
+                "color": df["color"][i],
+                "vin": df["vin"][i],
+                "purchase_price": float(price[i]),
+            }
+            for i in good
+        ]
+    elif file_type == "movements":
+        bad_req = (df["from_location"].eq("") | df["to_location"].eq("")) & ~bad
+        for i in df.index[bad_req]:
+            errors.append((row_nums[i], f"Строка {row_nums[i]}: from_location и to_location обязательны"))
+        bad |= df["from_location"].eq("") | df["to_location"].eq("")
+
+        good = df.index[~bad]
+        data = [
+            {
+                "date": dates[i].to_pydatetime(),
+                "vin": df["vin"][i],
+                "from_location": df["from_location"][i],
+                "to_location": df["to_location"][i],
+            }
+            for i in good
+        ]
+    else:  # sales
+        bad_buyer = df["buyer_name"].eq("") & ~bad
+        for i in df.index[bad_buyer]:
+            errors.append((row_nums[i], f"Строка {row_nums[i]}: buyer_name обязателен"))
+        bad |= df["buyer_name"].eq("")
+
+        price = pd.to_numeric(df["sale_price"].str.replace(",", ".", regex=False), errors="coerce")
+        bad_price = price.isna() & ~bad
+        for i in df.index[bad_price]:
+            errors.append((row_nums[i], f"Строка {row_nums[i]}: неверная цена продажи '{df['sale_price'][i]}'"))
+        bad |= price.isna()
+
+        good = df.index[~bad]
+        data = [
+            {
+                "date": dates[i].to_pydatetime(),
+                "vin": df["vin"][i],
+                "buyer_name": df["buyer_name"][i],
+                "sale_price": float(price[i]),
+            }
+            for i in good
+        ]
+
+    errors.sort(key=lambda pair: pair[0])
+    error_msgs = [msg for _, msg in errors]
+    return FileLoadResult(success=len(error_msgs) == 0, data=data, errors=error_msgs)
+
+
+def iter_arrivals_stream(stream: Any, errors: List[str]) -> Iterator[dict]:
+    """
+    Построчный генератор валидных записей о поступлениях из открытого
+    текстового потока. Колонки: date;model;color;vin;purchase_price
+    Память — O(1) от размера данных; ошибки пишутся в переданный список.
     """
-    Прочитать CSV с поступлениями.
+    reader = csv.reader(stream, delimiter=";")
+    header = next(reader, None)
+    if header is None:
+        return
+    # индексы колонок вычисляются один раз — без dict на каждую строку
+    idx = {name.strip(): i for i, name in enumerate(header)}
+    i_date = idx.get("date", -1)
+    i_model = idx.get("model", -1)
+    i_color = idx.get("color", -1)
+    i_vin = idx.get("vin", -1)
+    i_price = idx.get("purchase_price", -1)
+    for row_num, row in enumerate(reader, start=2):
+        if not row:  # csv.reader отдаёт пустые строки как [], DictReader их пропускал
+            continue
+        raw_date = _cell(row, i_date)
+        date_val = validate_date(raw_date)
+        if date_val is None:
+            errors.append(f"Строка {row_num}: неверная дата '{raw_date}'")
+            logger.warning("Row %d: invalid date", row_num)
+            continue
+        vin = _cell(row, i_vin)
+        if not validate_vin(vin):
+            errors.append(f"Строка {row_num}: неверный VIN '{vin}' (ожидается 17 букв/цифр)")
+            logger.warning("Row %d: invalid VIN", row_num)
+            continue
+        raw_price = _cell(row, i_price)
+        try:
+            price = float(raw_price.replace(",", "."))
+        except ValueError:
+            errors.append(f"Строка {row_num}: неверная цена закупки '{raw_price}'")
+            continue
+        model = _cell(row, i_model)
+        color = _cell(row, i_color)
+        if not model or not color:
+            errors.append(f"Строка {row_num}: модель и цвет обязательны")
+            continue
+        yield {
+            "date": date_val,
+            "model": model,
+            "color": color,
+            "vin": vin,
+            "purchase_price": price,
+        }
+
+
+def iter_arrivals_file(file_path: str, errors: List[str]) -> Iterator[dict]:
+    """
+    Построчный генератор валидных записей о поступлениях из файла.
     Колонки: date;model;color;vin;purchase_price
     """
-    data: List[dict] = []
-    errors: List[str] = []
     path = Path(file_path)
-
     if not path.exists():
         errors.append(f"Файл не найден: {file_path}")
         logger.error("File not found: %s", file_path)
-        return FileLoadResult(success=False, data=[], errors=errors)
+        return
 
     try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            reader = csv.DictReader(f, delimiter=";")
-            for row_num, row in enumerate(reader, start=2):
-                row = {k.strip(): v for k, v in row.items()} if row else {}
-                date_val = validate_date(row.get("date", ""))
-                if date_val is None:
-                    errors.append(f"Строка {row_num}: неверная дата '{row.get('date', '')}'")
-                    logger.warning("Row %d: invalid date", row_num)
-                    continue
-                vin = (row.get("vin") or "").strip()
-                if not validate_vin(vin):
-                    errors.append(f"Строка {row_num}: неверный VIN '{vin}' (ожидается 17 букв/цифр)")
-                    logger.warning("Row %d: invalid VIN", row_num)
-                    continue
-                try:
-                    price = float((row.get("purchase_price") or "").replace(",", ".").strip())
-                except (ValueError, TypeError):
-                    errors.append(f"Строка {row_num}: неверная цена закупки '{row.get('purchase_price')}'")
-                    continue
-                model = (row.get("model") or "").strip()
-                color = (row.get("color") or "").strip()
-                if not model or not color:
-                    errors.append(f"Строка {row_num}: модель и цвет обязательны")
-                    continue
-                data.append({
-                    "date": date_val,
-                    "model": model,
-                    "color": color,
-                    "vin": vin,
-                    "purchase_price": price,
-                })
+        with open(path, "r", encoding="utf-8", newline="", buffering=_READ_BUFFER) as f:
+            yield from iter_arrivals_stream(f, errors)
     except OSError as e:
         errors.append(f"Ошибка чтения файла: {e}")
         logger.exception("Error reading file %s", file_path)
-        return FileLoadResult(success=False, data=[], errors=errors)
 
+
+def parse_arrivals_file(file_path: str) -> FileLoadResult:
+    """
+    Прочитать CSV с поступлениями целиком (список в памяти).
+    Колонки: date;model;color;vin;purchase_price
+    Для потоковой обработки больших файлов см. iter_arrivals_file.
+    """
+    if pd is not None and Path(file_path).exists():
+        return _parse_file_vectorized(Path(file_path), "arrivals")
+    errors: List[str] = []
+    data = list(iter_arrivals_file(file_path, errors))
     return FileLoadResult(success=len(errors) == 0, data=data, errors=errors)
 
 
-def parse_movements_file(file_path: str) -> FileLoadResult:
+def iter_movements_stream(stream: Any, errors: List[str]) -> Iterator[dict]:
+    """
+    Построчный генератор валидных записей о перемещениях из открытого
+    текстового потока. Колонки: date;vin;from_location;to_location
     """
-    Прочитать CSV с перемещениями.
+    reader = csv.reader(stream, delimiter=";")
+    header = next(reader, None)
+    if header is None:
+        return
+    idx = {name.strip(): i for i, name in enumerate(header)}
+    i_date = idx.get("date", -1)
+    i_vin = idx.get("vin", -1)
+    i_from = idx.get("from_location", -1)
+    i_to = idx.get("to_location", -1)
+    for row_num, row in enumerate(reader, start=2):
+        if not row:  # csv.reader отдаёт пустые строки как [], DictReader их пропускал
+            continue
+        raw_date = _cell(row, i_date)
+        date_val = validate_date(raw_date)
+        if date_val is None:
+            errors.append(f"Строка {row_num}: неверная дата '{raw_date}'")
+            continue
+        vin = _cell(row, i_vin)
+        if not validate_vin(vin):
+            errors.append(f"Строка {row_num}: неверный VIN '{vin}'")
+            continue
+        from_loc = _cell(row, i_from)
+        to_loc = _cell(row, i_to)
+        if not from_loc or not to_loc:
+            errors.append(f"Строка {row_num}: from_location и to_location обязательны")
+            continue
+        yield {
+            "date": date_val,
+            "vin": vin,
+            "from_location": from_loc,
+            "to_location": to_loc,
+        }
+
+
+def iter_movements_file(file_path: str, errors: List[str]) -> Iterator[dict]:
+    """
+    Построчный генератор валидных записей о перемещениях из файла.
     Колонки: date;vin;from_location;to_location
     """
-    data: List[dict] = []
-    errors: List[str] = []
     path = Path(file_path)
-
     if not path.exists():
         errors.append(f"Файл не найден: {file_path}")
         logger.error("File not found: %s", file_path)
-        return FileLoadResult(success=False, data=[], errors=errors)
+        return
 
     try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            reader = csv.DictReader(f, delimiter=";")
-            for row_num, row in enumerate(reader, start=2):
-                row = {k.strip(): v for k, v in row.items()} if row else {}
-                date_val = validate_date(row.get("date", ""))
-                if date_val is None:
-                    errors.append(f"Строка {row_num}: неверная дата '{row.get('date', '')}'")
-                    continue
-                vin = (row.get("vin") or "").strip()
-                if not validate_vin(vin):
-                    errors.append(f"Строка {row_num}: неверный VIN '{vin}'")
-                    continue
-                from_loc = (row.get("from_location") or "").strip()
-                to_loc = (row.get("to_location") or "").strip()
-                if not from_loc or not to_loc:
-                    errors.append(f"Строка {row_num}: from_location и to_location обязательны")
-                    continue
-                data.append({
-                    "date": date_val,
-                    "vin": vin,
-                    "from_location": from_loc,
-                    "to_location": to_loc,
-                })
+        with open(path, "r", encoding="utf-8", newline="", buffering=_READ_BUFFER) as f:
+            yield from iter_movements_stream(f, errors)
     except OSError as e:
         errors.append(f"Ошибка чтения файла: {e}")
         logger.exception("Error reading file %s", file_path)
-        return FileLoadResult(success=False, data=[], errors=errors)
 
+
+def parse_movements_file(file_path: str) -> FileLoadResult:
+    """
+    Прочитать CSV с перемещениями целиком (список в памяти).
+    Колонки: date;vin;from_location;to_location
+    Для потоковой обработки больших файлов см. iter_movements_file.
+    """
+    if pd is not None and Path(file_path).exists():
+        return _parse_file_vectorized(Path(file_path), "movements")
+    errors: List[str] = []
+    data = list(iter_movements_file(file_path, errors))
     return FileLoadResult(success=len(errors) == 0, data=data, errors=errors)
 
 
-def parse_sales_file(file_path: str) -> FileLoadResult:
+def iter_sales_stream(stream: Any, errors: List[str]) -> Iterator[dict]:
     """
-    Прочитать CSV с продажами.
+    Построчный генератор валидных записей о продажах из открытого
+    текстового потока. Колонки: date;vin;buyer_name;sale_price
+    """
+    reader = csv.reader(stream, delimiter=";")
+    header = next(reader, None)
+    if header is None:
+        return
+    idx = {name.strip(): i for i, name in enumerate(header)}
+    i_date = idx.get("date", -1)
+    i_vin = idx.get("vin", -1)
+    i_buyer = idx.get("buyer_name", -1)
+    i_price = idx.get("sale_price", -1)
+    for row_num, row in enumerate(reader, start=2):
+        if not row:  # csv.reader отдаёт пустые строки как [], DictReader их пропускал
+            continue
+        raw_date = _cell(row, i_date)
+        date_val = validate_date(raw_date)
+        if date_val is None:
+            errors.append(f"Строка {row_num}: неверная дата '{raw_date}'")
+            continue
+        vin = _cell(row, i_vin)
+        if not validate_vin(vin):
+            errors.append(f"Строка {row_num}: неверный VIN '{vin}'")
+            continue
+        buyer_name = _cell(row, i_buyer)
+        if not buyer_name:
+            errors.append(f"Строка {row_num}: buyer_name обязателен")
+            continue
+        raw_price = _cell(row, i_price)
+        try:
+            sale_price = float(raw_price.replace(",", "."))
+        except ValueError:
+            errors.append(f"Строка {row_num}: неверная цена продажи '{raw_price}'")
+            continue
+        yield {
+            "date": date_val,
+            "vin": vin,
+            "buyer_name": buyer_name,
+            "sale_price": sale_price,
+        }
+
+
+def iter_sales_file(file_path: str, errors: List[str]) -> Iterator[dict]:
+    """
+    Построчный генератор валидных записей о продажах из файла.
     Колонки: date;vin;buyer_name;sale_price
     """
-    data: List[dict] = []
-    errors: List[str] = []
     path = Path(file_path)
-
     if not path.exists():
         errors.append(f"Файл не найден: {file_path}")
         logger.error("File not found: %s", file_path)
-        return FileLoadResult(success=False, data=[], errors=errors)
+        return
 
     try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            reader = csv.DictReader(f, delimiter=";")
-            for row_num, row in enumerate(reader, start=2):
-                row = {k.strip(): v for k, v in row.items()} if row else {}
-                date_val = validate_date(row.get("date", ""))
-                if date_val is None:
-                    errors.append(f"Строка {row_num}: неверная дата '{row.get('date', '')}'")
-                    continue
-                vin = (row.get("vin") or "").strip()
-                if not validate_vin(vin):
-                    errors.append(f"Строка {row_num}: неверный VIN '{vin}'")
-                    continue
-                buyer_name = (row.get("buyer_name") or "").strip()
-                if not buyer_name:
-                    errors.append(f"Строка {row_num}: buyer_name обязателен")
-                    continue
-                try:
-                    sale_price = float((row.get("sale_price") or "").replace(",", ".").strip())
-                except (ValueError, TypeError):
-                    errors.append(f"Строка {row_num}: неверная цена продажи '{row.get('sale_price')}'")
-                    continue
-                data.append({
-                    "date": date_val,
-                    "vin": vin,
-                    "buyer_name": buyer_name,
-                    "sale_price": sale_price,
-                })
+        with open(path, "r", encoding="utf-8", newline="", buffering=_READ_BUFFER) as f:
+            yield from iter_sales_stream(f, errors)
     except OSError as e:
         errors.append(f"Ошибка чтения файла: {e}")
         logger.exception("Error reading file %s", file_path)
-        return FileLoadResult(success=False, data=[], errors=errors)
 
+
+def parse_sales_file(file_path: str) -> FileLoadResult:
+    """
+    Прочитать CSV с продажами целиком (список в памяти).
+    Колонки: date;vin;buyer_name;sale_price
+    Для потоковой обработки больших файлов см. iter_sales_file.
+    """
+    if pd is not None and Path(file_path).exists():
+        return _parse_file_vectorized(Path(file_path), "sales")
+    errors: List[str] = []
+    data = list(iter_sales_file(file_path, errors))
     return FileLoadResult(success=len(errors) == 0, data=data, errors=errors)
 
 
 # --- Импорт в БД ---
 
-def import_arrivals(db: Session, data: List[dict]) -> dict[str, Any]:
+def _load_cars_by_vin(db: Session, vins: List[str]) -> dict[str, models.Car]:
+    """
+    Загрузить автомобили по списку VIN одним IN-запросом (чанками),
+    вместо отдельного SELECT на каждую строку файла.
+    """
+    unique_vins = list(set(vins))
+    cars: dict[str, models.Car] = {}
+    for i in range(0, len(unique_vins), _CHUNK_SIZE):
+        chunk = unique_vins[i:i + _CHUNK_SIZE]
+        for car in db.query(models.Car).filter(models.Car.vin.in_(chunk)):
+            cars[car.vin] = car
+    return cars
+
+
+def _iter_chunks(data: Iterable[dict], size: int = _CHUNK_SIZE) -> Iterator[List[dict]]:
+    """Резать поток записей на пакеты по size штук (последний может быть короче)."""
+    it = iter(data)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def import_arrivals(db: Session, data: Iterable[dict]) -> dict[str, Any]:
     """
     Импорт поступлений в БД. Пропуск записей с дубликатом VIN.
+    Дедупликацию выполняет сама БД: INSERT ... ON CONFLICT(vin) DO NOTHING
+    с RETURNING — без предварительного SELECT существующих VIN.
+    Принимает любой итерируемый источник (список или генератор) и
+    обрабатывает его пакетами — память не зависит от размера файла.
     Возвращает: {"imported": int, "skipped": int, "errors": List[str]}
     """
     imported = 0
-    skipped = 0
+    total = 0
     errors: List[str] = []
 
-    for item in data:
-        if crud.get_car_by_vin(db, item["vin"]):
-            skipped += 1
-            continue
-        try:
-            car_in = schemas.CarCreate(
-                vin=item["vin"],
-                model=item["model"],
-                color=item["color"],
-                purchase_price=item["purchase_price"],
-                arrival_date=item["date"],
-            )
-            crud.create_car(db, car_in)
-            imported += 1
-        except Exception as e:
-            errors.append(f"VIN {item.get('vin', '?')}: {e}")
-            logger.exception("Import arrival failed for VIN %s", item.get("vin"))
+    try:
+        now = datetime.utcnow()
+        for chunk in _iter_chunks(data):
+            total += len(chunk)
+            # Дубликаты VIN внутри пакета схлопываются (первая запись выигрывает);
+            # дубликаты между пакетами и с БД отсекает ON CONFLICT
+            item_by_vin: dict[str, dict] = {}
+            for item in chunk:
+                item_by_vin.setdefault(item["vin"], item)
+
+            # Вставленные строки возвращаются через RETURNING,
+            # конфликтующие (дубликат VIN) молча пропускаются БД
+            inserted = db.execute(
+                sqlite_insert(models.Car)
+                .on_conflict_do_nothing(index_elements=["vin"])
+                .returning(models.Car.id, models.Car.vin),
+                [
+                    {
+                        "vin": item["vin"],
+                        "model": item["model"],
+                        "color": item["color"],
+                        "purchase_price": item["purchase_price"],
+                        "arrival_date": item["date"],
+                        "status": "на складе",
+                        "location": "склад",
+                    }
+                    for item in item_by_vin.values()
+                ],
+            ).all()
+
+            # Операции «поступление» — только для фактически вставленных строк
+            db.bulk_insert_mappings(models.Operation, [
+                {
+                    "car_id": car_id,
+                    "operation_type": "поступление",
+                    "date": now,
+                    "details": (
+                        f"Поступление автомобиля VIN {vin}, "
+                        f"{item_by_vin[vin]['model']}"
+                    ),
+                    "user": "system",
+                }
+                for car_id, vin in inserted
+            ])
+            imported += len(inserted)
+        skipped = total - imported
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        errors.append(f"Ошибка пакетной вставки: {e}")
+        logger.exception("Bulk import of arrivals failed")
+        return {"imported": 0, "skipped": total - imported, "errors": errors}
 
     return {"imported": imported, "skipped": skipped, "errors": errors}
 
 
-def import_movements(db: Session, data: List[dict]) -> dict[str, Any]:
+def import_movements(db: Session, data: Iterable[dict]) -> dict[str, Any]:
     """
-    Импорт перемещений в БД через crud.move_car.
+    Импорт перемещений в БД. Валидация и история считаются в Python по
+    предзагруженным автомобилям, в БД уходят только пакетные запросы:
+    по одному UPDATE на каждую уникальную конечную пару (location, status)
+    и bulk-вставки Movement и Operation по пакетам.
+    Принимает любой итерируемый источник; память ограничена размером пакета
+    (плюс итоговое состояние по каждому затронутому автомобилю).
     Возвращает: {"imported": int, "skipped": int, "errors": List[str]}
     """
     imported = 0
     skipped = 0
     errors: List[str] = []
 
-    for item in data:
-        movement = crud.move_car(
-            db,
-            vin=item["vin"],
-            from_location=item["from_location"],
-            to_location=item["to_location"],
-            date=item["date"],
-        )
-        if movement:
-            imported += 1
-        else:
-            skipped += 1
-            errors.append(
-                f"VIN {item['vin']}: автомобиль не найден или неверное местоположение "
-                f"({item['from_location']} -> {item['to_location']})"
-            )
+    cars_by_vin: dict[str, models.Car] = {}
+    # Текущее местоположение отслеживается в Python: автомобиль может
+    # перемещаться несколько раз в одном файле, в БД пишется итоговое состояние
+    locations: dict[str, str] = {}
+    final_state: dict[str, tuple[str, str]] = {}  # vin -> (location, status)
+
+    try:
+        for chunk in _iter_chunks(data):
+            # Подгрузить автомобили пакета, которых ещё нет в кеше
+            missing = [item["vin"] for item in chunk if item["vin"] not in cars_by_vin]
+            if missing:
+                loaded = _load_cars_by_vin(db, missing)
+                cars_by_vin.update(loaded)
+                locations.update({vin: car.location for vin, car in loaded.items()})
+
+            movement_rows: List[dict] = []
+            op_rows: List[dict] = []
+            for item in chunk:
+                vin = item["vin"]
+                car = cars_by_vin.get(vin)
+                if car is None:
+                    skipped += 1
+                    errors.append(f"VIN {vin}: автомобиль не найден")
+                    continue
+                current = locations[vin]
+                # Проверка текущего местоположения (пропуск, если from_location пустой)
+                if item["from_location"] and current != item["from_location"]:
+                    skipped += 1
+                    errors.append(
+                        f"VIN {vin}: неверное местоположение "
+                        f"({item['from_location']} -> {item['to_location']})"
+                    )
+                    continue
+                to_location = item["to_location"]
+                movement_rows.append({
+                    "car_id": car.id,
+                    "date": item["date"],
+                    "from_location": current,
+                    "to_location": to_location,
+                })
+                op_rows.append({
+                    "car_id": car.id,
+                    "operation_type": "перемещение",
+                    "date": item["date"],
+                    "details": f"Перемещение VIN {vin}: {current} -> {to_location}",
+                    "user": "system",
+                })
+                locations[vin] = to_location
+                final_state[vin] = (to_location, crud._status_by_location(to_location))
+                imported += 1
+
+            db.bulk_insert_mappings(models.Movement, movement_rows)
+            db.bulk_insert_mappings(models.Operation, op_rows)
+
+        # Группируем итоговые состояния: один UPDATE ... WHERE id IN (...)
+        # на каждую уникальную пару (location, status) вместо UPDATE на строку
+        groups: dict[tuple[str, str], List[int]] = defaultdict(list)
+        for vin, state in final_state.items():
+            groups[state].append(cars_by_vin[vin].id)
+        for (location, status), car_ids in groups.items():
+            for i in range(0, len(car_ids), _CHUNK_SIZE):
+                db.execute(
+                    update(models.Car)
+                    .where(models.Car.id.in_(car_ids[i:i + _CHUNK_SIZE]))
+                    .values(location=location, status=status)
+                    .execution_options(synchronize_session=False)
+                )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        errors.append(f"Ошибка импорта перемещений: {e}")
+        logger.exception("Bulk import of movements failed")
+        return {"imported": 0, "skipped": skipped, "errors": errors}
 
     return {"imported": imported, "skipped": skipped, "errors": errors}
 
 
-def import_sales(db: Session, data: List[dict]) -> dict[str, Any]:
+def import_sales(db: Session, data: Iterable[dict]) -> dict[str, Any]:
     """
     Импорт продаж в БД через crud.sell_car.
+    Принимает любой итерируемый источник и обрабатывает его пакетами;
+    весь файл фиксируется одной транзакцией (commit=False в цикле,
+    один commit в конце).
     Возвращает: {"imported": int, "skipped": int, "errors": List[str]}
     """
     imported = 0
     skipped = 0
     errors: List[str] = []
 
-    for item in data:
-        sold = crud.sell_car(
-            db,
-            vin=item["vin"],
-            sale_price=item["sale_price"],
-            buyer_name=item["buyer_name"],
-            sale_date=item["date"],
-        )
-        if sold:
-            imported += 1
-        else:
-            skipped += 1
-            errors.append(
-                f"VIN {item['vin']}: автомобиль не найден или уже продан"
-            )
+    cars_by_vin: dict[str, models.Car] = {}
+
+    try:
+        for chunk in _iter_chunks(data):
+            missing = [item["vin"] for item in chunk if item["vin"] not in cars_by_vin]
+            if missing:
+                cars_by_vin.update(_load_cars_by_vin(db, missing))
+
+            op_rows: List[dict] = []
+            for item in chunk:
+                car = cars_by_vin.get(item["vin"])
+                if car is None:
+                    skipped += 1
+                    errors.append(f"VIN {item['vin']}: автомобиль не найден")
+                    continue
+                sold = crud._sell_car_for_object(
+                    db,
+                    car,
+                    sale_price=item["sale_price"],
+                    buyer_name=item["buyer_name"],
+                    sale_date=item["date"],
+                    commit=False,
+                    op_rows=op_rows,
+                )
+                if sold:
+                    imported += 1
+                else:
+                    skipped += 1
+                    errors.append(f"VIN {item['vin']}: автомобиль уже продан")
+            # Операции «продажа» — одной пакетной вставкой на пакет
+            db.bulk_insert_mappings(models.Operation, op_rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        errors.append(f"Ошибка импорта продаж: {e}")
+        logger.exception("Bulk import of sales failed")
+        return {"imported": 0, "skipped": skipped, "errors": errors}
 
     return {"imported": imported, "skipped": skipped, "errors": errors}
 
 
-def process_file(db: Session, file_path: str, file_type: str) -> dict[str, Any]:
-    """
-    Определить тип файла (arrivals / movements / sales), распарсить и импортировать в БД.
-    Возвращает полный результат: парсинг + импорт.
-    """
-    file_type = file_type.lower().strip()
-    if file_type not in ("arrivals", "movements", "sales"):
-        return {
-            "parse": {"success": False, "data_count": 0, "errors": [f"Неизвестный тип файла: {file_type}"]},
-            "import": {"imported": 0, "skipped": 0, "errors": []},
-        }
+# Диспетчеризация по типу файла — общие таблицы для process_file/process_stream
+_FILE_ITERATORS = {
+    "arrivals": iter_arrivals_file,
+    "movements": iter_movements_file,
+    "sales": iter_sales_file,
+}
+_STREAM_ITERATORS = {
+    "arrivals": iter_arrivals_stream,
+    "movements": iter_movements_stream,
+    "sales": iter_sales_stream,
+}
+_PARSERS = {
+    "arrivals": parse_arrivals_file,
+    "movements": parse_movements_file,
+    "sales": parse_sales_file,
+}
+_IMPORTERS = {
+    "arrivals": import_arrivals,
+    "movements": import_movements,
+    "sales": import_sales,
+}
+
+def _unknown_type_result(file_type: str) -> dict[str, Any]:
+    """Результат для неизвестного типа файла."""
+    return {
+        "parse": {"success": False, "data_count": 0, "errors": [f"Неизвестный тип файла: {file_type}"]},
+        "import": {"imported": 0, "skipped": 0, "errors": []},
+    }
 
-    if file_type == "arrivals":
-        parse_result = parse_arrivals_file(file_path)
-        import_result = import_arrivals(db, parse_result.data) if parse_result.data else {"imported": 0, "skipped": 0, "errors": []}
-    elif file_type == "movements":
-        parse_result = parse_movements_file(file_path)
-        import_result = import_movements(db, parse_result.data) if parse_result.data else {"imported": 0, "skipped": 0, "errors": []}
-    else:  # sales
-        parse_result = parse_sales_file(file_path)
-        import_result = import_sales(db, parse_result.data) if parse_result.data else {"imported": 0, "skipped": 0, "errors": []}
 
+def _finish_import(
+    db: Session, file_type: str, rows: Iterable[dict], parse_errors: List[str]
+) -> dict[str, Any]:
+    """Прогнать записи через импортёр и собрать итоговый результат парсинг + импорт."""
+    import_result = _IMPORTERS[file_type](db, rows)
+    data_count = import_result["imported"] + import_result["skipped"]
     return {
         "parse": {
-            "success": parse_result.success,
-            "data_count": len(parse_result.data),
-            "errors": parse_result.errors,
+            "success": len(parse_errors) == 0,
+            "data_count": data_count,
+            "errors": parse_errors,
         },
         "import": import_result,
     }
+
+
+def process_file(db: Session, file_path: str, file_type: str) -> dict[str, Any]:
+    """
+    Распарсить файл указанного типа (arrivals / movements / sales) и импортировать в БД.
+    Возвращает полный результат: парсинг + импорт.
+    """
+    file_type = file_type.lower().strip()
+    if file_type not in _IMPORTERS:
+        return _unknown_type_result(file_type)
+
+    parse_errors: List[str] = []
+    if pd is not None:
+        # Векторизованный парсер возвращает готовый список — отдаём его как есть
+        parse_result = _PARSERS[file_type](file_path)
+        parse_errors.extend(parse_result.errors)
+        rows: Iterable[dict] = parse_result.data
+    else:
+        # Потоковый путь: файл не собирается в список, записи идут
+        # из генератора прямо в пакетный импортёр
+        rows = _FILE_ITERATORS[file_type](file_path, parse_errors)
+
+    return _finish_import(db, file_type, rows, parse_errors)
+
+
+def process_stream(db: Session, stream: Any, file_type: str) -> dict[str, Any]:
+    """
+    Распарсить CSV из открытого текстового потока и импортировать в БД —
+    без сохранения во временный файл и повторного чтения с диска.
+    Поток читается ровно один раз; вызывающий отвечает за его закрытие.
+    """
+    file_type = file_type.lower().strip()
+    if file_type not in _IMPORTERS:
+        return _unknown_type_result(file_type)
+
+    parse_errors: List[str] = []
+    if pd is not None:
+        parse_result = _parse_file_vectorized(stream, file_type)
+        parse_errors.extend(parse_result.errors)
+        rows: Iterable[dict] = parse_result.data
+    else:
+        rows = _STREAM_ITERATORS[file_type](stream, parse_errors)
+
+    return _finish_import(db, file_type, rows, parse_errors)
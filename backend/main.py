@@ -2,7 +2,12 @@
 FastAPI приложение: Система управления продажами автомобилей.
 """
 
+import io
+import shutil
 import tempfile
+
+import anyio.to_thread
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
@@ -13,8 +18,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from backend import crud, file_loader, models, reports, schemas
-from backend.database import Base, engine, get_db
+# file_loader и reports импортируются лениво внутри обработчиков:
+# file_loader тянет опциональный pandas, и воркеры, не обслуживающие
+# загрузку файлов/отчёты, не платят за это памятью и временем старта
+from backend import crud, models, schemas
+from backend.database import Base, engine, get_db, migrate_schema
 
 
 # Тела запросов для API (date/sale_date опциональны)
@@ -84,7 +92,7 @@ def get_car(car_id: int, db: Session = Depends(get_db)):
 @cars_router.post("", response_model=schemas.CarResponse, status_code=201)
 def create_car(car_in: schemas.CarCreate, db: Session = Depends(get_db)):
     """Создать новый автомобиль."""
-    if crud.get_car_by_vin(db, car_in.vin):
+    if crud.vin_exists(db, car_in.vin):
         raise HTTPException(status_code=400, detail="Автомобиль с таким VIN уже существует")
     return crud.create_car(db, car_in)
 
@@ -111,10 +119,11 @@ def delete_car(car_id: int, db: Session = Depends(get_db)):
 @movements_router.post("", response_model=schemas.MovementResponse, status_code=201)
 def create_movement(body: MovementCreateBody, db: Session = Depends(get_db)):
     """Создать перемещение автомобиля по VIN."""
-    car = crud.get_car_by_vin(db, body.vin)
-    if not car:
+    # Узкая проверка (id, status) — полный автомобиль загрузит move_car
+    car_row = crud.get_car_status_by_vin(db, body.vin)
+    if car_row is None:
         raise HTTPException(status_code=404, detail="Автомобиль не найден")
-    if car.status == "продан":
+    if car_row[1] == "продан":
         raise HTTPException(status_code=400, detail="Автомобиль уже продан")
     date_val = body.date if body.date is not None else datetime.utcnow()
     movement = crud.move_car(
@@ -153,10 +162,11 @@ def list_car_movements(car_id: int, db: Session = Depends(get_db)):
 @sales_router.post("", response_model=schemas.CarResponse, status_code=201)
 def create_sale(body: SaleCreateBody, db: Session = Depends(get_db)):
     """Продать автомобиль по VIN."""
-    car = crud.get_car_by_vin(db, body.vin)
-    if not car:
+    # Узкая проверка (id, status) — полный автомобиль загрузит sell_car
+    car_row = crud.get_car_status_by_vin(db, body.vin)
+    if car_row is None:
         raise HTTPException(status_code=404, detail="Автомобиль не найден")
-    if car.status == "продан":
+    if car_row[1] == "продан":
         raise HTTPException(status_code=400, detail="Автомобиль уже продан")
     sold = crud.sell_car(
         db,
@@ -194,114 +204,226 @@ def list_buyers(
 
 # --- Эндпоинты: загрузка файлов ---
 
+# Директория для временных файлов загрузки — создаётся один раз при старте,
+# без mkdir-syscall на каждый запрос
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+
 def _save_upload_and_process(
     file: UploadFile,
     db: Session,
-    file_type: str,
+    file_type: Optional[str] = None,
 ) -> dict:
-    """Сохранить загруженный файл во временную директорию и вызвать process_file."""
-    data_dir = Path("data")
-    data_dir.mkdir(parents=True, exist_ok=True)
-    suffix = Path(file.filename or "upload").suffix or ".csv"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=data_dir) as tmp:
-        content = file.file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    """
+    Импортировать загруженный CSV напрямую из потока запроса: без записи
+    во временный файл и повторного чтения с диска — Starlette сам буферизует
+    большие загрузки в SpooledTemporaryFile.
+    file_type=None — тип определяется по заголовкам; в этом случае
+    в ответ добавляется detected_type.
+    """
+    from backend import file_loader
+
+    detected = None
+    if file_type is None:
+        first_line = file.file.readline(4096).decode("utf-8", "replace")
+        file.file.seek(0)
+        detected = _detect_type_from_line(first_line)
+        if not detected:
+            raise HTTPException(
+                status_code=400,
+                detail="Не удалось определить тип файла по заголовкам. Ожидаются: arrivals (date;model;color;vin;purchase_price), movements (date;vin;from_location;to_location), sales (date;vin;buyer_name;sale_price)",
+            )
+        file_type = detected
+
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
     try:
-        result = file_loader.process_file(db, tmp_path, file_type)
-        parse_info = result["parse"]
-        import_info = result["import"]
-        errors = list(parse_info.get("errors", [])) + list(import_info.get("errors", []))
-        return {
-            "filename": file.filename or "upload",
-            "parsed": parse_info.get("data_count", 0),
-            "imported": import_info.get("imported", 0),
-            "skipped": import_info.get("skipped", 0),
-            "errors": errors,
-        }
+        result = file_loader.process_stream(db, stream, file_type)
     finally:
-        Path(tmp_path).unlink(missing_ok=True)
+        # detach вместо close: исходным файлом владеет Starlette
+        stream.detach()
+    parse_info = result["parse"]
+    import_info = result["import"]
+    errors = list(parse_info.get("errors", [])) + list(import_info.get("errors", []))
+    response = {
+        "filename": file.filename or "upload",
+        "parsed": parse_info.get("data_count", 0),
+        "imported": import_info.get("imported", 0),
+        "skipped": import_info.get("skipped", 0),
+        "errors": errors,
+    }
+    if detected is not None:
+        response["detected_type"] = detected
+    return response
+
+
+# Канонический порядок колонок: сравнение по префиксу строки —
+# ни одной аллокации на запрос для файлов со стандартным заголовком
+_HEADER_PREFIXES = (
+    ("arrivals", "date;model;color;vin;purchase_price"),
+    ("movements", "date;vin;from_location;to_location"),
+    ("sales", "date;vin;buyer_name;sale_price"),
+)
+
+# Эталонные наборы заголовков — модульные константы, а не set на каждый запрос
+# (запасной путь для файлов с переставленными или дополнительными колонками)
+_ARRIVALS_HDR = frozenset({"date", "model", "color", "vin", "purchase_price"})
+_MOVEMENTS_HDR = frozenset({"date", "vin", "from_location", "to_location"})
+_SALES_HDR = frozenset({"date", "vin", "buyer_name", "sale_price"})
 
 
 def _detect_file_type(file_path: str) -> Optional[str]:
-    """Определить тип CSV по первой строке (заголовкам). Разделитель — точка с запятой."""
+    """Определить тип CSV-файла по первой строке (заголовкам)."""
     path = Path(file_path)
     if not path.exists():
         return None
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        first_line = f.readline()
-    headers = {h.strip() for h in first_line.split(";")}
-    if headers >= {"date", "model", "color", "vin", "purchase_price"}:
+    # Строка заголовков умещается в первые 4 КиБ; бинарное чтение
+    # не декодирует лишнего и не строит текстовый буфер на весь файл
+    with open(path, "rb") as f:
+        first_line = f.readline(4096).decode("utf-8", "replace")
+    return _detect_type_from_line(first_line)
+
+
+def _detect_type_from_line(first_line: str) -> Optional[str]:
+    """Определить тип CSV по строке заголовков. Разделитель — точка с запятой."""
+    # Быстрый путь: заголовок в каноническом порядке — чистый startswith
+    normalized = first_line.strip().lower()
+    for file_type, prefix in _HEADER_PREFIXES:
+        if normalized.startswith(prefix):
+            return file_type
+    headers = frozenset(h.strip() for h in first_line.split(";"))
+    if headers >= _ARRIVALS_HDR:
         return "arrivals"
-    if headers >= {"date", "vin", "from_location", "to_location"}:
+    if headers >= _MOVEMENTS_HDR:
         return "movements"
-    if headers >= {"date", "vin", "buyer_name", "sale_price"}:
+    if headers >= _SALES_HDR:
         return "sales"
     return None
 
 
+# Загрузка файлов — заведомо медленный путь (диск + парсинг + импорт в БД).
+# Эндпоинты объявлены async, а блокирующая работа уходит в поток через
+# anyio.to_thread.run_sync: цикл событий продолжает принимать соединения,
+# пока файл обрабатывается.
+
 @files_router.post("/upload/arrivals")
-def upload_arrivals(
+async def upload_arrivals(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-):
+) -> dict:
     """Загрузить CSV с поступлениями и импортировать в БД."""
-    return _save_upload_and_process(file, db, "arrivals")
+    return await anyio.to_thread.run_sync(_save_upload_and_process, file, db, "arrivals")
 
 
 @files_router.post("/upload/movements")
-def upload_movements(
+async def upload_movements(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-):
+) -> dict:
     """Загрузить CSV с перемещениями и импортировать в БД."""
-    return _save_upload_and_process(file, db, "movements")
+    return await anyio.to_thread.run_sync(_save_upload_and_process, file, db, "movements")
 
 
 @files_router.post("/upload/sales")
-def upload_sales(
+async def upload_sales(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-):
+) -> dict:
     """Загрузить CSV с продажами и импортировать в БД."""
-    return _save_upload_and_process(file, db, "sales")
+    return await anyio.to_thread.run_sync(_save_upload_and_process, file, db, "sales")
+
+
+def _process_batch(files: list[UploadFile], db: Session) -> dict:
+    """
+    Обработать пакет CSV-файлов (тип определяется по заголовкам).
+    Парсинг файлов выполняется параллельно в пуле процессов — чистый CPU-bound
+    код не ограничен GIL; импорт в БД идёт последовательно (БД — общая точка
+    сериализации).
+    """
+    from backend import file_loader
+
+    parsers = {
+        "arrivals": file_loader.parse_arrivals_file,
+        "movements": file_loader.parse_movements_file,
+        "sales": file_loader.parse_sales_file,
+    }
+    importers = {
+        "arrivals": file_loader.import_arrivals,
+        "movements": file_loader.import_movements,
+        "sales": file_loader.import_sales,
+    }
+
+    saved: list[tuple[str, str, Optional[str]]] = []  # (filename, tmp_path, file_type)
+    try:
+        for file in files:
+            suffix = Path(file.filename or "upload").suffix or ".csv"
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=DATA_DIR) as tmp:
+                # Потоковое копирование через буфер 1 МиБ: память не зависит
+                # от размера загружаемого файла (read() собрал бы его целиком)
+                shutil.copyfileobj(file.file, tmp, length=1 << 20)
+                tmp_path = tmp.name
+            saved.append((file.filename or "upload", tmp_path, _detect_file_type(tmp_path)))
+
+        # Параллельный парсинг (процессы — из-за GIL потоки здесь не помогут)
+        parse_results: dict[str, file_loader.FileLoadResult] = {}
+        with ProcessPoolExecutor(max_workers=min(len(saved), 3) or 1) as pool:
+            futures = {
+                tmp_path: pool.submit(parsers[file_type], tmp_path)
+                for _, tmp_path, file_type in saved
+                if file_type is not None
+            }
+            for tmp_path, future in futures.items():
+                parse_results[tmp_path] = future.result()
+
+        # Последовательный импорт в порядке загрузки файлов
+        results = []
+        for filename, tmp_path, file_type in saved:
+            if file_type is None:
+                results.append({
+                    "filename": filename,
+                    "detected_type": None,
+                    "parsed": 0,
+                    "imported": 0,
+                    "skipped": 0,
+                    "errors": ["Не удалось определить тип файла по заголовкам"],
+                })
+                continue
+            parse_result = parse_results[tmp_path]
+            import_result = (
+                importers[file_type](db, parse_result.data)
+                if parse_result.data
+                else {"imported": 0, "skipped": 0, "errors": []}
+            )
+            results.append({
+                "filename": filename,
+                "detected_type": file_type,
+                "parsed": len(parse_result.data),
+                "imported": import_result["imported"],
+                "skipped": import_result["skipped"],
+                "errors": list(parse_result.errors) + list(import_result["errors"]),
+            })
+        return {"files": results}
+    finally:
+        for _, tmp_path, _ in saved:
+            Path(tmp_path).unlink(missing_ok=True)
+
+
+@files_router.post("/upload/batch")
+async def upload_batch(
+    files: list[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+) -> dict:
+    """Загрузить несколько CSV за один запрос (тип определяется по заголовкам)."""
+    return await anyio.to_thread.run_sync(_process_batch, files, db)
 
 
 @files_router.post("/upload/auto")
-def upload_auto(
+async def upload_auto(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-):
+) -> dict:
     """Загрузить CSV с автоматическим определением типа по заголовкам."""
-    data_dir = Path("data")
-    data_dir.mkdir(parents=True, exist_ok=True)
-    suffix = Path(file.filename or "upload").suffix or ".csv"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=data_dir) as tmp:
-        content = file.file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
-    try:
-        file_type = _detect_file_type(tmp_path)
-        if not file_type:
-            Path(tmp_path).unlink(missing_ok=True)
-            raise HTTPException(
-                status_code=400,
-                detail="Не удалось определить тип файла по заголовкам. Ожидаются: arrivals (date;model;color;vin;purchase_price), movements (date;vin;from_location;to_location), sales (date;vin;buyer_name;sale_price)",
-            )
-        result = file_loader.process_file(db, tmp_path, file_type)
-        parse_info = result["parse"]
-        import_info = result["import"]
-        errors = list(parse_info.get("errors", [])) + list(import_info.get("errors", []))
-        return {
-            "filename": file.filename or "upload",
-            "detected_type": file_type,
-            "parsed": parse_info.get("data_count", 0),
-            "imported": import_info.get("imported", 0),
-            "skipped": import_info.get("skipped", 0),
-            "errors": errors,
-        }
-    finally:
-        Path(tmp_path).unlink(missing_ok=True)
+    return await anyio.to_thread.run_sync(_save_upload_and_process, file, db, None)
 
 
 # --- Эндпоинты: отчёты ---
@@ -311,20 +433,26 @@ def report_sales(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     db: Session = Depends(get_db),
-):
+) -> dict:
     """Отчёт о продажах за период (опционально start_date, end_date)."""
+    from backend import reports
+
     return reports.generate_sales_report(db, start_date=start_date, end_date=end_date)
 
 
 @reports_router.get("/stock")
-def report_stock(db: Session = Depends(get_db)):
+def report_stock(db: Session = Depends(get_db)) -> dict:
     """Отчёт об остатках на складе."""
+    from backend import reports
+
     return reports.generate_stock_report(db)
 
 
 @reports_router.get("/buyers")
-def report_buyers(db: Session = Depends(get_db)):
+def report_buyers(db: Session = Depends(get_db)) -> dict:
     """Отчёт о покупателях и проданных автомобилях."""
+    from backend import reports
+
     return reports.generate_buyers_report(db)
 
 
@@ -341,8 +469,14 @@ def list_operations(
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Создание таблиц БД при старте приложения."""
+    """Создание таблиц БД и настройка пула потоков при старте приложения."""
     Base.metadata.create_all(bind=engine)
+    # Довести существующие БД до актуальной схемы (новые колонки и индексы)
+    migrate_schema()
+    # Стандартный лимит AnyIO — 40 потоков на все sync-эндпоинты и run_sync;
+    # поднимаем до ёмкости пула соединений БД (pool_size + max_overflow),
+    # чтобы потоки не простаивали в очереди раньше, чем кончатся соединения
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 50
     yield
 
 
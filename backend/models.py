@@ -3,7 +3,7 @@ SQLAlchemy-модели для системы управления продаж
 """
 
 from sqlalchemy import (
-    Column, Integer, String, Float, DateTime, Text, ForeignKey,
+    Column, Integer, String, Float, DateTime, Text, ForeignKey, Index,
 )
 from sqlalchemy.orm import relationship
 
@@ -19,6 +19,11 @@ class Buyer(Base):
     name = Column(String(200), nullable=False)  # ФИО
     phone = Column(String(20), nullable=True)  # телефон
     email = Column(String(100), nullable=True)  # email
+    # Денормализованные агрегаты покупок: обновляются атомарным UPDATE
+    # при каждой продаже (crud._sell_car_for_object), отчёт о покупателях
+    # читает их напрямую без JOIN + GROUP BY по автомобилям
+    total_spent = Column(Float, default=0.0, index=True, nullable=False)
+    purchases_count = Column(Integer, default=0, nullable=False)
 
     # Связь: один покупатель — много автомобилей (проданных ему)
     cars = relationship("Car", back_populates="buyer")
@@ -28,18 +33,23 @@ class Car(Base):
     """Автомобиль."""
 
     __tablename__ = "cars"
+    # Составной индекс под отчёт о продажах: фильтр по status
+    # с диапазоном по sale_date в одном проходе по индексу
+    __table_args__ = (
+        Index("ix_cars_status_sale_date", "status", "sale_date"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    vin = Column(String(17), unique=True, nullable=False)  # VIN-код
+    vin = Column(String(17), unique=True, index=True, nullable=False)  # VIN-код
     model = Column(String(100), nullable=False)  # модель автомобиля
     color = Column(String(50), nullable=False)  # цвет
     purchase_price = Column(Float, nullable=False)  # цена закупки
     sale_price = Column(Float, nullable=True)  # цена продажи
-    status = Column(String(20), default="на складе", nullable=False)  # на складе, продан, в демозале, на сервисе
+    status = Column(String(20), default="на складе", index=True, nullable=False)  # на складе, продан, в демозале, на сервисе
     location = Column(String(100), default="склад", nullable=False)  # текущее местоположение
-    arrival_date = Column(DateTime, nullable=False)  # дата поступления
-    sale_date = Column(DateTime, nullable=True)  # дата продажи
-    buyer_id = Column(Integer, ForeignKey("buyers.id"), nullable=True)
+    arrival_date = Column(DateTime, index=True, nullable=False)  # дата поступления
+    sale_date = Column(DateTime, index=True, nullable=True)  # дата продажи
+    buyer_id = Column(Integer, ForeignKey("buyers.id"), index=True, nullable=True)
 
     # Связи
     buyer = relationship("Buyer", back_populates="cars")
@@ -53,8 +63,8 @@ class Movement(Base):
     __tablename__ = "movements"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    car_id = Column(Integer, ForeignKey("cars.id"), nullable=False)
-    date = Column(DateTime, nullable=False)
+    car_id = Column(Integer, ForeignKey("cars.id"), index=True, nullable=False)
+    date = Column(DateTime, index=True, nullable=False)
     from_location = Column(String(100), nullable=False)
     to_location = Column(String(100), nullable=False)
 
@@ -67,9 +77,9 @@ class Operation(Base):
     __tablename__ = "operations"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    car_id = Column(Integer, ForeignKey("cars.id"), nullable=True)
+    car_id = Column(Integer, ForeignKey("cars.id"), index=True, nullable=True)
     operation_type = Column(String(50), nullable=False)  # поступление, перемещение, продажа
-    date = Column(DateTime, nullable=False)
+    date = Column(DateTime, index=True, nullable=False)  # журнал сортируется по дате
     details = Column(Text, nullable=True)  # детали операции
     user = Column(String(100), default="system", nullable=False)
 
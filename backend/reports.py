@@ -2,10 +2,11 @@
 Генерация отчётов: продажи, остатки.
 """
 
+from collections import defaultdict
 from datetime import datetime
 from typing import Any, Optional
 
-from sqlalchemy import func
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from backend import models
@@ -20,37 +21,17 @@ def generate_sales_report(
     Отчёт о продажах за период: количество, сумма, прибыль, детализация по моделям.
     Если даты не заданы — учитываются все проданные автомобили.
     """
-    q = db.query(models.Car).filter(models.Car.status == "продан")
-    if start_date is not None:
-        q = q.filter(models.Car.sale_date >= start_date)
-    if end_date is not None:
-        q = q.filter(models.Car.sale_date <= end_date)
-
-    sold = q.all()
-
-    total_count = len(sold)
-    total_sales = sum(c.sale_price or 0 for c in sold)
-    total_purchase = sum(c.purchase_price for c in sold)
-    total_profit = total_sales - total_purchase
-    average_price = total_sales / total_count if total_count else 0.0
-
-    # Период: фактические границы по датам продаж или переданные
-    sale_dates = [c.sale_date for c in sold if c.sale_date]
-    if sale_dates:
-        min_d = min(sale_dates)
-        max_d = max(sale_dates)
-        period_start = min_d.date() if hasattr(min_d, "date") else min_d
-        period_end = max_d.date() if hasattr(max_d, "date") else max_d
-    else:
-        period_start = start_date.date() if start_date and hasattr(start_date, "date") else None
-        period_end = end_date.date() if end_date and hasattr(end_date, "date") else None
-
-    # Детализация по моделям через group_by
+    # Один агрегирующий запрос вместо двух с одинаковым фильтром:
+    # GROUP BY model с min/max дат, общие итоги складываются в Python
+    # из O(моделей) строк. SQLite не поддерживает GROUPING SETS,
+    # поэтому «оба уровня агрегации одним запросом» достигаются так.
     q_agg = db.query(
         models.Car.model,
         func.count(models.Car.id).label("count"),
         func.sum(models.Car.sale_price).label("total"),
         func.sum(models.Car.sale_price - models.Car.purchase_price).label("profit"),
+        func.min(models.Car.sale_date).label("min_date"),
+        func.max(models.Car.sale_date).label("max_date"),
     ).filter(models.Car.status == "продан")
     if start_date is not None:
         q_agg = q_agg.filter(models.Car.sale_date >= start_date)
@@ -58,15 +39,36 @@ def generate_sales_report(
         q_agg = q_agg.filter(models.Car.sale_date <= end_date)
     by_model_rows = q_agg.group_by(models.Car.model).all()
 
-    by_model = [
-        {
+    total_count = 0
+    total_sales = 0.0
+    total_profit = 0.0
+    min_d = None
+    max_d = None
+    by_model = []
+    for row in by_model_rows:
+        total_count += row.count
+        total_sales += float(row.total or 0)
+        total_profit += float(row.profit or 0)
+        if row.min_date is not None and (min_d is None or row.min_date < min_d):
+            min_d = row.min_date
+        if row.max_date is not None and (max_d is None or row.max_date > max_d):
+            max_d = row.max_date
+        by_model.append({
             "model": row.model,
             "count": row.count,
             "total": float(row.total or 0),
             "profit": float(row.profit or 0),
-        }
-        for row in by_model_rows
-    ]
+        })
+
+    average_price = total_sales / total_count if total_count else 0.0
+
+    # Период: фактические границы по датам продаж или переданные
+    if min_d is not None:
+        period_start = min_d.date() if hasattr(min_d, "date") else min_d
+        period_end = max_d.date() if hasattr(max_d, "date") else max_d
+    else:
+        period_start = start_date.date() if start_date and hasattr(start_date, "date") else None
+        period_end = end_date.date() if end_date and hasattr(end_date, "date") else None
 
     return {
         "period": {"start": period_start, "end": period_end},
@@ -83,44 +85,63 @@ def generate_stock_report(db: Session) -> dict[str, Any]:
     Отчёт об остатках на складе: автомобили со статусом != «продан».
     Группировка по моделям и цветам, список автомобилей в каждой группе.
     """
-    cars = (
-        db.query(models.Car)
+    # Агрегаты считает БД: один GROUP BY вместо цикла по всем автомобилям
+    agg_rows = (
+        db.query(
+            models.Car.model,
+            models.Car.color,
+            func.count(models.Car.id).label("count"),
+            func.sum(models.Car.purchase_price).label("value"),
+        )
         .filter(models.Car.status != "продан")
-        .order_by(models.Car.model, models.Car.color, models.Car.vin)
+        .group_by(models.Car.model, models.Car.color)
+        .order_by(models.Car.model, models.Car.color)
         .all()
     )
 
-    total_count = len(cars)
-    total_value = sum(c.purchase_price for c in cars)
-
-    # Группировка: model -> color -> список машин
+    total_count = 0
+    total_value = 0.0
     by_model: list[dict[str, Any]] = []
-    model_map: dict[str, int] = {}  # model -> index в by_model
+    color_map: dict[tuple[str, str], dict[str, Any]] = {}  # (model, color) -> группа
 
-    for car in cars:
-        if car.model not in model_map:
-            model_map[car.model] = len(by_model)
+    for model, color, count, value in agg_rows:
+        if not by_model or by_model[-1]["model"] != model:
             by_model.append({
-                "model": car.model,
+                "model": model,
                 "count": 0,
                 "value": 0.0,
                 "by_color": [],
             })
-        mi = model_map[car.model]
-        by_model[mi]["count"] += 1
-        by_model[mi]["value"] += car.purchase_price
-
-        # Найти или создать группу по цвету
-        by_color_list = by_model[mi]["by_color"]
-        color_entry = next((e for e in by_color_list if e["color"] == car.color), None)
-        if color_entry is None:
-            color_entry = {"color": car.color, "count": 0, "cars": []}
-            by_color_list.append(color_entry)
-        color_entry["count"] += 1
-        color_entry["cars"].append({
-            "vin": car.vin,
-            "purchase_price": car.purchase_price,
-            "location": car.location,
+        entry = by_model[-1]
+        entry["count"] += count
+        entry["value"] += float(value or 0)
+        color_entry = {"color": color, "count": count, "cars": []}
+        entry["by_color"].append(color_entry)
+        color_map[(model, color)] = color_entry
+        total_count += count
+        total_value += float(value or 0)
+
+    # Списки автомобилей внутри групп: Core-select нужных колонок без
+    # ORM-гидратации, yield_per стримит строки пакетами — результат
+    # не собирается в промежуточный список перед группировкой.
+    # Раскладка по готовому dict — O(1) на строку вместо линейного поиска
+    detail_rows = db.execute(
+        select(
+            models.Car.model,
+            models.Car.color,
+            models.Car.vin,
+            models.Car.purchase_price,
+            models.Car.location,
+        )
+        .where(models.Car.status != "продан")
+        .order_by(models.Car.model, models.Car.color, models.Car.vin)
+        .execution_options(yield_per=1000)
+    )
+    for model, color, vin, purchase_price, location in detail_rows:
+        color_map[(model, color)]["cars"].append({
+            "vin": vin,
+            "purchase_price": purchase_price,
+            "location": location,
         })
 
     return {
@@ -136,34 +157,57 @@ def generate_buyers_report(db: Session) -> dict[str, Any]:
     для каждого — купленные автомобили с деталями.
     Покупатели отсортированы по сумме покупок (убывание).
     """
-    buyers = db.query(models.Buyer).all()
-    buyers_data: list[dict[str, Any]] = []
-
-    for buyer in buyers:
-        cars = [c for c in buyer.cars if c.status == "продан"]
-        total_spent = sum(c.sale_price or 0 for c in cars)
-        cars_list = [
-            {
-                "vin": c.vin,
-                "model": c.model,
-                "color": c.color,
-                "sale_price": c.sale_price or 0,
-                "sale_date": c.sale_date.strftime("%Y-%m-%d") if c.sale_date else "",
-                "profit": (c.sale_price or 0) - c.purchase_price,
-            }
-            for c in cars
-        ]
-        buyers_data.append({
-            "name": buyer.name,
-            "phone": buyer.phone or "",
-            "email": buyer.email or "",
-            "purchases_count": len(cars),
-            "total_spent": total_spent,
-            "cars": cars_list,
+    # Агрегаты не пересчитываются: total_spent и purchases_count
+    # поддерживаются на строке покупателя при каждой продаже, отчёту
+    # остаётся прочитать их с сортировкой по индексированной колонке
+    buyer_rows = db.execute(
+        select(
+            models.Buyer.id,
+            models.Buyer.name,
+            models.Buyer.phone,
+            models.Buyer.email,
+            models.Buyer.purchases_count,
+            models.Buyer.total_spent,
+        )
+        .order_by(models.Buyer.total_spent.desc(), models.Buyer.id)
+    ).all()
+
+    # Детализация покупок: только нужные колонки, раскладка по buyer_id
+    cars_by_buyer: dict[int, list[dict[str, Any]]] = defaultdict(list)
+    detail_rows = db.execute(
+        select(
+            models.Car.buyer_id,
+            models.Car.vin,
+            models.Car.model,
+            models.Car.color,
+            models.Car.sale_price,
+            models.Car.sale_date,
+            models.Car.purchase_price,
+        )
+        .where(models.Car.status == "продан", models.Car.buyer_id.is_not(None))
+        .execution_options(yield_per=1000)
+    )
+    for buyer_id, vin, model, color, sale_price, sale_date, purchase_price in detail_rows:
+        cars_by_buyer[buyer_id].append({
+            "vin": vin,
+            "model": model,
+            "color": color,
+            "sale_price": sale_price or 0,
+            "sale_date": sale_date.strftime("%Y-%m-%d") if sale_date else "",
+            "profit": (sale_price or 0) - purchase_price,
         })
 
-    # Сортировка по сумме покупок (от большей к меньшей)
-    buyers_data.sort(key=lambda b: b["total_spent"], reverse=True)
+    buyers_data = [
+        {
+            "name": row.name,
+            "phone": row.phone or "",
+            "email": row.email or "",
+            "purchases_count": row.purchases_count,
+            "total_spent": float(row.total_spent),
+            "cars": cars_by_buyer.get(row.id, []),
+        }
+        for row in buyer_rows
+    ]
 
     return {
         "total_buyers": len(buyers_data),